@@ -1,23 +1,23 @@
 import streamlit as st
 import pandas as pd
 import random
+import time
 from pathlib import Path
 import sys
-from modules.config import ENTITY_COLORS, ENTITY_GROUPS, MODEL_REPO, MODEL_SUBFOLDERS, EXAMPLES_FILE
-from modules.models import load_ner_model, predict_entities
+from modules.config import ENTITY_COLORS, ENTITY_GROUPS, MODEL_REPO, MODEL_SUBFOLDERS, MODEL_TIERS, EXAMPLES_FILE
+from modules.models import load_ner_model, load_gazetteer_automaton, iter_entities, limit_text, bundled_entities, start_warm_up
 from modules.visualization import color_text, hex_to_rgba, escape_html
 
 # Добавляем пути для импорта модулей (актуально для локального запуска и деплоя)
 sys.path.append(str(Path(__file__).parent))
 
+@st.cache_data
 def load_examples(file_path):
-    """Загружает примеры резюме из CSV"""
-    print(f"Loading examples from {file_path}")
+    """Загружает примеры резюме из CSV (один раз, дальше из кэша)"""
     try:
-        p = Path(file_path)
-        print(p)
-        if not p.exists():
+        if not Path(file_path).exists():
             st.warning(f"Файл с примерами не найден: {file_path}")
+            return []
         df = pd.read_csv(file_path)
         return df.to_dict('records')
     except Exception as e:
@@ -25,6 +25,34 @@ def load_examples(file_path):
         return []
 
 
+# Минимальный интервал (сек) между перерисовками результатов во время анализа
+RENDER_INTERVAL = 0.3
+
+
+def render_metrics(container, entities):
+    """Счётчики над документом (перерисовываются в том же месте)"""
+    with container.container():
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.metric("Найдено сущностей", len(entities))
+        with c2:
+            conf = sum(e['confidence'] for e in entities) / len(entities) if entities else 0
+            st.metric("Уверенность", f"{conf:.2f}")
+        with c3:
+            st.metric("Источник", st.session_state.get('input_source', 'Ввод вручную'))
+
+
+def render_document(container, text, entities):
+    """Документ с подсветкой найденных на данный момент сущностей"""
+    colored_html = color_text(text, entities, ENTITY_COLORS)
+    with container.container():
+        st.subheader("📄 Визуализация")
+        st.markdown(
+            f'<div style="background-color: white; padding: 20px; border-radius: 10px; border: 1px solid #eee; line-height: 2.0; color: black;">{colored_html}</div>',
+            unsafe_allow_html=True
+        )
+
+
 def main():
     st.set_page_config(
         page_title="NER для IT-резюме",
@@ -48,9 +76,21 @@ def main():
         st.header("⚙️ Настройки")
 
         st.subheader("Модели")
+        tier = st.radio(
+            "Режим",
+            options=list(MODEL_TIERS.keys()),
+            format_func=lambda t: MODEL_TIERS[t],
+            help="Общий энкодер считает текст один раз для всех трёх групп. Быстрый режим — маленькая модель, обученная повторять три BERT-модели (для CPU)."
+        )
         use_g1 = st.checkbox("Group 1 (Стандартные)", value=True)
         use_g2 = st.checkbox("Group 2 (Компании/Технологии)", value=True)
         use_g3 = st.checkbox("Group 3 (Опыт/Навыки)", value=True)
+        fast_g2 = st.checkbox(
+            "⚡ Быстрый режим Group 2 (словарь)",
+            value=False,
+            disabled=not use_g2,
+            help="Компании и технологии ищутся по словарю вместо модели: мгновенно, но только точные совпадения. Модель Group 2 не запускается, поэтому имена (NAME) в этом режиме не выделяются."
+        )
 
         st.divider()
         st.subheader("🎨 Легенда")
@@ -77,15 +117,27 @@ def main():
         st.stop()
 
     # Загружаем модели
-    # Мы не передаем аргументы, так как функция сама возьмет всё из config.py
+    # Пути и репозиторий функция берёт из config.py, передаём только выбранный режим
     with st.spinner("🔄 Инициализация нейросетей..."):
-        all_pipelines = load_ner_model()
+        all_pipelines = load_ner_model(tier)
         # Оставляем только те, что выбраны пользователем
         pipelines = {k: v for k, v in all_pipelines.items() if k in active_groups}
 
+    gazetteer = None
+    if use_g2 and fast_g2:
+        gazetteer = load_gazetteer_automaton()
+        if gazetteer is None:
+            st.sidebar.warning("Словарь не собран, Group 2 работает через модель.")
+        else:
+            st.sidebar.caption("⚡ Словарь Group 2 включён: NAME (имена) не выделяется.")
+
     # Загружаем примеры
     examples = load_examples(EXAMPLES_FILE)
-    print(examples)
+
+    # Фоновый прогон моделей, чтобы первый анализ не был «холодным» (примеры берутся из готовой разметки)
+    if examples:
+        start_warm_up(tier, examples[0]['text'])
+
     # Кнопки Управления
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -122,30 +174,44 @@ def main():
 
     analyze_button = st.button("🔍 Анализировать", type="primary", use_container_width=True)
 
-    # Обработка
+    # Обработка: результаты дорисовываются по мере того, как модели заканчивают окна текста
     if analyze_button and text.strip():
-        with st.spinner("🧠 Модели изучают ваше резюме..."):
-            entities = predict_entities(text, pipelines)
-            st.session_state['entities'] = entities
-
         st.subheader("📊 Результаты")
-        c1, c2, c3 = st.columns(3)
-        with c1:
-            st.metric("Найдено сущностей", len(entities))
-        with c2:
-            conf = sum(e['confidence'] for e in entities) / len(entities) if entities else 0
-            st.metric("Уверенность", f"{conf:.2f}")
-        with c3:
-            st.metric("Источник", st.session_state.get('input_source', 'Ввод вручную'))
+        # Слишком длинный текст обрезаем сразу, чтобы и анализ, и подсветка работали с одной и той же частью
+        text, truncated = limit_text(text)
+        if truncated:
+            st.warning(f"⚠️ Текст слишком длинный: анализируются и показываются первые {len(text):,} символов.")
+        progress_slot = st.empty()
+        metrics_slot = st.empty()
+        document_slot = st.empty()
+
+        # Примеры из data/ уже размечены заранее (modules.example_bundle) — модели не запускаются
+        entities = bundled_entities(text, tier, list(pipelines), gazetteer=gazetteer)
+        if entities is None:
+            progress = progress_slot.progress(0.0, text="🧠 Модели изучают ваше резюме...")
+            entities = []
+            group_progress = {group_name: 0.0 for group_name in pipelines}
+            last_render = 0.0
+            for group_name, window_idx, n_windows, new_entities in iter_entities(text, pipelines, gazetteer=gazetteer):
+                entities.extend(new_entities)
+                group_progress[group_name] = (window_idx + 1) / n_windows
+                done = sum(group_progress.values()) / len(group_progress)
+                progress.progress(done, text=f"🧠 Модели изучают ваше резюме... {done:.0%}")
+
+                # Перерисовка всего документа дорогая, поэтому не чаще RENDER_INTERVAL
+                if time.perf_counter() - last_render > RENDER_INTERVAL:
+                    render_metrics(metrics_slot, entities)
+                    render_document(document_slot, text, entities)
+                    last_render = time.perf_counter()
+
+            progress.empty()
+            entities.sort(key=lambda x: x['start'])
+
+        st.session_state['entities'] = entities
+        render_metrics(metrics_slot, entities)
 
         if entities:
-            st.subheader("📄 Визуализация")
-            colored_html = color_text(text, entities, ENTITY_COLORS)
-
-            st.markdown(
-                f'<div style="background-color: white; padding: 20px; border-radius: 10px; border: 1px solid #eee; line-height: 2.0; color: black;">{colored_html}</div>',
-                unsafe_allow_html=True
-            )
+            render_document(document_slot, text, entities)
 
             with st.expander("📋 Посмотреть таблицу всех найденных тегов"):
                 df_data = [{
@@ -156,13 +222,13 @@ def main():
                 } for e in entities]
                 st.dataframe(pd.DataFrame(df_data), use_container_width=True)
         else:
-            st.info("Сущности не обнаружены. Попробуйте другой текст или включите все группы моделей.")
+            document_slot.info("Сущности не обнаружены. Попробуйте другой текст или включите все группы моделей.")
 
     # Информация
     with st.expander("ℹ️ Подробнее о системе"):
         st.write(f"**Репозиторий моделей:** `{MODEL_REPO}`")
         st.write(
-            "Система использует три независимых NER-модели. Если сущности пересекаются, цвета накладываются друг на друга (эффект слоев).")
+            "Система использует три NER-модели (или одну модель с тремя головами). Если сущности пересекаются, цвета накладываются друг на друга (эффект слоев).")
 
 
 if __name__ == "__main__":
@@ -38,12 +38,53 @@ MODEL_SUBFOLDERS = {
     'group3': 'model_3'
 }
 
+# Сущности каждой модели-группы (те же списки, что и в легенде ENTITY_GROUPS)
+GROUP_ENTITIES = dict(zip(MODEL_SUBFOLDERS.keys(), ENTITY_GROUPS.values()))
+
 LOCAL_MODEL_PATHS = {
     'group1': str(BASE_DIR / 'models' / 'model_1_final'),
     'group2': str(BASE_DIR / 'models' / 'model_2_final'),
     'group3': str(BASE_DIR / 'models' / 'model_3_final')
 }
 
-EXAMPLES_FILE = 'app/data/examples.csv'
+# Дистиллированная модель (один маленький энкодер с тремя головами) для быстрого режима на CPU
+STUDENT_MODEL_PATH = str(BASE_DIR / 'models' / 'student')
+
+# Один BERT-энкодер с тремя головами, собранный из трёх моделей групп
+MERGED_MODEL_PATH = str(BASE_DIR / 'models' / 'model_merged')
+
+MODEL_TIERS = {
+    'standard': 'Точный (3 BERT-модели)',
+    'merged': 'Общий энкодер (1 BERT, 3 головы)',
+    'fast': 'Быстрый (дистиллированная модель)'
+}
+
+# Мультиголовые модели: режим -> папка
+MULTIHEAD_MODEL_PATHS = {
+    'merged': MERGED_MODEL_PATH,
+    'fast': STUDENT_MODEL_PATH
+}
+
+# Размеченные датасеты в IOB-формате (результат datasets_preprocess)
+DATASET_PATHS = {
+    'group1': str(BASE_DIR / 'datasets' / 'group1_dataset.jsonl'),
+    'group2': str(BASE_DIR / 'datasets' / 'group2_dataset.jsonl'),
+    'group3': str(BASE_DIR / 'datasets' / 'group3_dataset.jsonl')
+}
+
+# Экспорт Label Studio (исходный текст и символьные позиции), из которого собраны датасеты выше
+LABELED_RESUMES_FILE = str(BASE_DIR / 'datasets' / '307_labeled_resumes_no_duplicates.json')
+
+# Жёсткий предел длины анализируемого текста (символы); всё, что дальше, отбрасывается с предупреждением
+MAX_TEXT_CHARS = 300_000
+
+EXAMPLES_FILE = str(BASE_DIR / 'app' / 'data' / 'examples.csv')
+
+# Предрассчитанная разметка примеров: режим -> ревизия весов и сущности по группам (собирается modules.example_bundle)
+EXAMPLE_BUNDLE_FILE = str(BASE_DIR / 'app' / 'data' / 'example_annotations.json')
+
 
 
+# Словарь для быстрого режима Group 2 (собирается из прошлых предсказаний модели)
+GAZETTEER_FILE = str(BASE_DIR / 'app' / 'data' / 'gazetteer.json')
+GAZETTEER_LABELS = ['COMPANIES', 'TECHNOLOGIES']
@@ -0,0 +1,176 @@
+import argparse
+import random
+import time
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from torch.nn.utils.rnn import pad_sequence
+from transformers import AutoConfig, AutoModelForTokenClassification, AutoTokenizer
+
+from modules.config import BASE_DIR, LOCAL_MODEL_PATHS, STUDENT_MODEL_PATH
+from modules.multihead import MultiHeadTokenClassifier
+
+
+def read_corpus(folder, max_docs=None):
+    """Читает неразмеченные резюме (.txt, как после resumes_convertor.py)"""
+    files = sorted(Path(folder).glob("*.txt"))
+    if max_docs:
+        files = files[:max_docs]
+    texts = [f.read_text(encoding='utf-8') for f in files]
+    texts = [t for t in texts if t.strip()]
+    print(f"Загружено {len(texts)} резюме из {folder}")
+    return texts
+
+
+def make_windows(texts, tokenizer, max_length=512, stride=64):
+    """Нарезает тексты на окна так же, как пайплайн при инференсе"""
+    windows = []
+    for text in texts:
+        encoding = tokenizer(
+            text,
+            truncation=True,
+            max_length=max_length,
+            stride=stride,
+            return_overflowing_tokens=True
+        )
+        windows.extend(encoding['input_ids'])
+    print(f"Создано {len(windows)} окон")
+    return windows
+
+
+def _batches(items, batch_size):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
+def collect_teacher_logits(windows, teacher_paths, tokenizer, batch_size=8, device=None):
+    """
+    Прогоняет модели-учителя по окнам и сохраняет их логиты (float16, только реальные токены).
+    Учителя загружаются по очереди, чтобы в памяти был один BERT.
+    """
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    teacher_logits = {}
+    group_labels = {}
+
+    for group_name, path in teacher_paths.items():
+        print(f"Логиты учителя {group_name} ({path})...")
+        teacher = AutoModelForTokenClassification.from_pretrained(path).to(device)
+        teacher.eval()
+        group_labels[group_name] = [teacher.config.id2label[i] for i in range(teacher.config.num_labels)]
+
+        logits = []
+        for batch in _batches(windows, batch_size):
+            padded = tokenizer.pad({'input_ids': batch}, return_tensors='pt').to(device)
+            with torch.no_grad():
+                output = teacher(**padded).logits
+            for row, ids in zip(output, batch):
+                logits.append(row[:len(ids)].half().cpu())
+        teacher_logits[group_name] = logits
+
+        del teacher
+
+    return teacher_logits, group_labels
+
+
+def make_student(teacher_path, group_labels, num_layers=4, hidden_size=256, num_heads=4, intermediate_size=1024):
+    """Уменьшенная копия архитектуры учителя (тот же словарь) с головой на каждую группу"""
+    config = AutoConfig.from_pretrained(teacher_path)
+    config.num_hidden_layers = num_layers
+    config.hidden_size = hidden_size
+    config.num_attention_heads = num_heads
+    config.intermediate_size = intermediate_size
+    return MultiHeadTokenClassifier.from_config(config, group_labels)
+
+
+def distill_student(student, windows, teacher_logits, tokenizer, epochs=3, batch_size=16,
+                    lr=5e-4, temperature=2.0, device=None):
+    """Обучает студента повторять распределения учителей (KL-дивергенция, сумма по головам)"""
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    student.to(device)
+    student.train()
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr)
+
+    order = list(range(len(windows)))
+    for epoch in range(epochs):
+        random.shuffle(order)
+        total_loss, n_batches = 0.0, 0
+        start_time = time.time()
+
+        for batch_idx in _batches(order, batch_size):
+            padded = tokenizer.pad({'input_ids': [windows[i] for i in batch_idx]}, return_tensors='pt').to(device)
+            mask = padded['attention_mask'].bool()
+            outputs = student(**padded)
+
+            loss = 0.0
+            for group_name, logits in outputs.items():
+                target = pad_sequence(
+                    [teacher_logits[group_name][i] for i in batch_idx], batch_first=True
+                ).float().to(device)
+                log_p_student = F.log_softmax(logits / temperature, dim=-1)
+                p_teacher = F.softmax(target / temperature, dim=-1)
+                kl = (p_teacher * (torch.log(p_teacher.clamp_min(1e-9)) - log_p_student)).sum(-1)
+                loss = loss + kl[mask].mean() * temperature ** 2
+
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+            total_loss += loss.item()
+            n_batches += 1
+
+        print(f"Эпоха {epoch + 1}/{epochs}: loss {total_loss / max(n_batches, 1):.4f} ({time.time() - start_time:.1f} с)")
+
+    student.eval()
+    return student
+
+
+def train_student(texts, teacher_paths=LOCAL_MODEL_PATHS, output_dir=STUDENT_MODEL_PATH, num_layers=4,
+                  hidden_size=256, epochs=3, batch_size=16, stride=64):
+    """Полный цикл: окна -> логиты учителей -> обучение студента -> сохранение рядом с моделями"""
+    # Без текстов студент остался бы случайным, но всё равно сохранился бы и попал в приложение
+    if not texts:
+        raise ValueError("Корпус для дистилляции пуст: нет ни одного непустого .txt резюме")
+
+    first_teacher = next(iter(teacher_paths.values()))
+    tokenizer = AutoTokenizer.from_pretrained(first_teacher)
+
+    windows = make_windows(texts, tokenizer, stride=stride)
+    if not windows:
+        raise ValueError("Из корпуса не получилось ни одного окна для дистилляции")
+    teacher_logits, group_labels = collect_teacher_logits(windows, teacher_paths, tokenizer)
+
+    student = make_student(first_teacher, group_labels, num_layers=num_layers, hidden_size=hidden_size)
+    n_params = sum(p.numel() for p in student.parameters())
+    print(f"Студент: {num_layers} слоёв, hidden {hidden_size}, {n_params / 1e6:.1f}M параметров")
+
+    student = distill_student(student, windows, teacher_logits, tokenizer, epochs=epochs, batch_size=batch_size)
+
+    student.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Студент сохранён в {output_dir}")
+    return student
+
+
+# Запуск (из папки app/, работает и на CPU):
+# python -m modules.distillation --corpus ../hh_ru_API_parser/resumes_json/converted --max-docs 50 --epochs 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Дистилляция трёх групповых моделей в одну маленькую")
+    parser.add_argument('--corpus', default=str(BASE_DIR / 'hh_ru_API_parser' / 'resumes_json' / 'converted'))
+    parser.add_argument('--output', default=STUDENT_MODEL_PATH)
+    parser.add_argument('--max-docs', type=int, default=None)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--hidden', type=int, default=256)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    train_student(
+        read_corpus(args.corpus, args.max_docs),
+        output_dir=args.output,
+        num_layers=args.layers,
+        hidden_size=args.hidden,
+        epochs=args.epochs,
+        batch_size=args.batch_size
+    )
@@ -0,0 +1,226 @@
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from modules.config import GROUP_ENTITIES
+
+
+def iob_to_spans(sequences, label_index):
+    """
+    IOB-последовательности документов -> спаны {'doc', 'start', 'end', 'label'} (end не включительно, в токенах).
+    Все документы склеиваются в один массив, границы спанов находятся векторно.
+    Как в seqeval/HF: I-X после O или другой метки начинает новую сущность.
+    label_index — общий словарь {метка: id}, пополняется новыми метками.
+    """
+    lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+    if lengths.sum() == 0:
+        return _empty_spans()
+
+    # Теги кодируются числами через словарь (уникальных тегов единицы), дальше всё векторно
+    tag_ids = _TagCodes()
+    codes = np.fromiter(map(tag_ids.__getitem__, chain.from_iterable(sequences)), dtype=np.int64, count=int(lengths.sum()))
+
+    tag_type = np.full(len(tag_ids), -1, dtype=np.int64)
+    tag_begin = np.zeros(len(tag_ids), dtype=bool)
+    for tag, i in tag_ids.items():
+        prefix, _, label = str(tag).partition('-')
+        if tag == 'O' or not label:
+            continue
+        tag_type[i] = label_index.setdefault(label, len(label_index))
+        tag_begin[i] = prefix == 'B'
+
+    types = tag_type[codes]
+    is_begin = tag_begin[codes]
+    is_entity = types >= 0
+
+    doc_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    doc_start = np.zeros(len(types), dtype=bool)
+    doc_start[doc_offsets[:-1][lengths > 0]] = True
+
+    previous_type = np.concatenate([[-1], types[:-1]])
+    starts = is_entity & (is_begin | doc_start | (previous_type != types))
+    continues_next = np.concatenate([is_entity[1:] & ~starts[1:], [False]])
+    ends = is_entity & ~continues_next
+
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.flatnonzero(ends) + 1
+    doc = np.searchsorted(doc_offsets, start_idx, side='right') - 1
+    return {
+        'doc': doc,
+        'start': start_idx - doc_offsets[doc],
+        'end': end_idx - doc_offsets[doc],
+        'label': types[start_idx]
+    }
+
+
+class _TagCodes(dict):
+    """Словарь тег -> номер, новые теги получают следующий номер"""
+
+    def __missing__(self, tag):
+        self[tag] = len(self)
+        return self[tag]
+
+
+def entities_to_spans(documents, label_index):
+    """
+    Сущности документов -> спаны. Сущность — (start, end, label) или dict в формате
+    predict_entities ('label') / HF pipeline ('entity_group'); позиции — символы.
+    """
+    doc, start, end, label = [], [], [], []
+    for doc_idx, entities in enumerate(documents):
+        for entity in entities:
+            if isinstance(entity, dict):
+                entity = (entity['start'], entity['end'], entity.get('label', entity.get('entity_group')))
+            doc.append(doc_idx)
+            start.append(entity[0])
+            end.append(entity[1])
+            label.append(label_index.setdefault(entity[2], len(label_index)))
+
+    if not doc:
+        return _empty_spans()
+    return {
+        'doc': np.array(doc, dtype=np.int64),
+        'start': np.array(start, dtype=np.int64),
+        'end': np.array(end, dtype=np.int64),
+        'label': np.array(label, dtype=np.int64)
+    }
+
+
+def _empty_spans():
+    return {key: np.zeros(0, dtype=np.int64) for key in ('doc', 'start', 'end', 'label')}
+
+
+def _concat_spans(span_sets):
+    """Склеивает спаны нескольких запусков, добавляя номер запуска 'run'"""
+    merged = {key: np.concatenate([spans[key] for spans in span_sets]) for key in ('doc', 'start', 'end', 'label')}
+    merged['run'] = np.concatenate([np.full(len(spans['doc']), i, dtype=np.int64) for i, spans in enumerate(span_sets)])
+    return merged
+
+
+def _any_overlap(query_start, query_end, ref_start, ref_end):
+    """
+    Для каждого query-интервала: пересекается ли он хотя бы с одним ref-интервалом.
+    Интервалы уже сдвинуты так, что разные документы/метки/запуски не пересекаются.
+    """
+    if len(ref_start) == 0 or len(query_start) == 0:
+        return np.zeros(len(query_start), dtype=bool)
+    order = np.argsort(ref_start, kind='stable')
+    sorted_start = ref_start[order]
+    max_end = np.maximum.accumulate(ref_end[order])
+    idx = np.searchsorted(sorted_start, query_end, side='left') - 1
+    return (idx >= 0) & (max_end[np.maximum(idx, 0)] > query_start)
+
+
+def score_runs(gold, runs, n_labels):
+    """
+    Оценка нескольких запусков против одного эталона за один проход.
+    gold — спаны эталона, runs — список спанов запусков (общий label_index).
+    Возвращает массивы [запуск, метка]: tp, n_pred, n_gold, partial_tp_pred, partial_tp_gold.
+    """
+    n_runs = len(runs)
+    pred = _concat_spans(runs) if runs else dict(_empty_spans(), run=np.zeros(0, dtype=np.int64))
+    n_docs = int(max(gold['doc'].max(initial=-1), pred['doc'].max(initial=-1))) + 1
+    span_length = int(max(gold['end'].max(initial=0), pred['end'].max(initial=0))) + 1
+
+    # Строгое совпадение: (документ, начало, конец, метка) сворачиваются в одно число
+    def strict_key(spans):
+        return ((spans['label'] * n_docs + spans['doc']) * span_length + spans['start']) * span_length + spans['end']
+
+    strict_hit = np.isin(strict_key(pred), strict_key(gold))
+
+    # Частичное совпадение: пересечение с сущностью той же метки в том же документе
+    def shifted(spans, run=None):
+        line = spans['label'] * n_docs + spans['doc']
+        if run is not None:
+            line = run * n_labels * n_docs + line
+        return line * span_length + spans['start'], line * span_length + spans['end']
+
+    pred_start, pred_end = shifted(pred)
+    gold_start, gold_end = shifted(gold)
+    partial_pred = _any_overlap(pred_start, pred_end, gold_start, gold_end)
+
+    # Для recall эталон повторяется для каждого запуска, чтобы запуски не смешивались
+    gold_run = np.repeat(np.arange(n_runs, dtype=np.int64), len(gold['doc']))
+    gold_tiled = {key: np.tile(gold[key], n_runs) for key in ('doc', 'start', 'end', 'label')}
+    tiled_start, tiled_end = shifted(gold_tiled, gold_run)
+    pred_run_start, pred_run_end = shifted(pred, pred['run'])
+    partial_gold = _any_overlap(tiled_start, tiled_end, pred_run_start, pred_run_end)
+
+    def count(run, label, mask=None):
+        bins = run * n_labels + label
+        weights = None if mask is None else mask.astype(np.float64)
+        return np.bincount(bins, weights=weights, minlength=n_runs * n_labels).reshape(n_runs, n_labels)
+
+    return {
+        'tp': count(pred['run'], pred['label'], strict_hit),
+        'n_pred': count(pred['run'], pred['label']),
+        'n_gold': np.tile(np.bincount(gold['label'], minlength=n_labels), (n_runs, 1)),
+        'partial_tp_pred': count(pred['run'], pred['label'], partial_pred),
+        'partial_tp_gold': count(gold_run, gold_tiled['label'], partial_gold)
+    }
+
+
+def _prf(tp_pred, n_pred, tp_gold, n_gold):
+    tp_pred, n_pred, tp_gold, n_gold = (np.asarray(x, dtype=np.float64) for x in (tp_pred, n_pred, tp_gold, n_gold))
+    precision = np.divide(tp_pred, n_pred, out=np.zeros_like(tp_pred, dtype=np.float64), where=n_pred > 0)
+    recall = np.divide(tp_gold, n_gold, out=np.zeros_like(tp_gold, dtype=np.float64), where=n_gold > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros_like(precision), where=(precision + recall) > 0)
+    return precision, recall, f1
+
+
+def evaluate_runs(gold, runs, spans='iob', group_entities=GROUP_ENTITIES):
+    """
+    Метрики по сущностям для нескольких запусков (модели, страйды, режимы) против одного эталона.
+    gold — список документов, runs — {название запуска: список документов};
+    документ — IOB-последовательность (spans='iob') или список сущностей (spans='entities').
+    Возвращает DataFrame: строгие и частичные Precision/Recall/F1 по каждой метке,
+    micro по группам (group1/2/3) и по всем сущностям.
+    """
+    to_spans = iob_to_spans if spans == 'iob' else entities_to_spans
+    label_index = {}
+    gold_spans = to_spans(gold, label_index)
+    run_names = list(runs.keys())
+    run_spans = [to_spans(runs[name], label_index) for name in run_names]
+
+    counts = score_runs(gold_spans, run_spans, len(label_index))
+    labels = sorted(label_index, key=label_index.get)
+    label_group = {label: group for group, entities in group_entities.items() for label in entities}
+
+    # Агрегаты: по группам и по всем меткам (micro — суммы счётчиков)
+    rows_index = [(label_group.get(label, '-'), label, [label_index[label]]) for label in labels]
+    for group in group_entities:
+        ids = [label_index[label] for label in labels if label_group.get(label) == group]
+        if ids:
+            rows_index.append((group, 'ALL', ids))
+    rows_index.append(('ALL', 'ALL', list(range(len(labels)))))
+
+    rows = []
+    for run_idx, run_name in enumerate(run_names):
+        for group, label, ids in rows_index:
+            summed = {key: values[run_idx, ids].sum() for key, values in counts.items()}
+            precision, recall, f1 = _prf(summed['tp'], summed['n_pred'], summed['tp'], summed['n_gold'])
+            p_partial, r_partial, f1_partial = _prf(
+                summed['partial_tp_pred'], summed['n_pred'], summed['partial_tp_gold'], summed['n_gold']
+            )
+            rows.append({
+                'Запуск': run_name,
+                'Группа': group,
+                'Сущность': label,
+                'Precision': float(precision),
+                'Recall': float(recall),
+                'F1-Score': float(f1),
+                'Precision (частично)': float(p_partial),
+                'Recall (частично)': float(r_partial),
+                'F1-Score (частично)': float(f1_partial),
+                'Support': int(summed['n_gold'])
+            })
+
+    return pd.DataFrame(rows)
+
+
+# Использование:
+# metrics = evaluate_runs(gold_tags, {'stride=64': tags_64, 'stride=128': tags_128})
+# metrics[metrics['Сущность'] == 'ALL']  # сводка по группам
+# Для сущностей по символам (predict_entities): evaluate_runs(gold_entities, runs, spans='entities')
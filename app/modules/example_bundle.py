@@ -0,0 +1,126 @@
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from modules.config import EXAMPLE_BUNDLE_FILE, EXAMPLES_FILE, LOCAL_MODEL_PATHS, MODEL_TIERS, MULTIHEAD_MODEL_PATHS
+
+# Сколько байт с начала и с конца файла весов идёт в отпечаток (весь файл хешировать долго)
+FINGERPRINT_BYTES = 1 << 20
+
+
+def text_key(text):
+    """Ключ примера в бандле — хеш текста, поэтому отредактированный пример считается заново"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def model_revision(tier):
+    """
+    Отпечаток моделей режима: имена и размеры файлов, начало и конец весов.
+    Меняется при переобучении или замене модели; None, если модели нет на диске.
+    """
+    paths = [MULTIHEAD_MODEL_PATHS[tier]] if tier in MULTIHEAD_MODEL_PATHS else list(LOCAL_MODEL_PATHS.values())
+    digest = hashlib.sha1(tier.encode('utf-8'))
+
+    for path in paths:
+        files = sorted(p for p in Path(path).rglob('*') if p.is_file() and p.suffix in ('.json', '.txt', '.safetensors', '.bin'))
+        if not files:
+            return None
+        for file in files:
+            size = file.stat().st_size
+            digest.update(f"{file.relative_to(path)}:{size}".encode('utf-8'))
+            with open(file, 'rb') as f:
+                digest.update(f.read(FINGERPRINT_BYTES))
+                if size > 2 * FINGERPRINT_BYTES:
+                    f.seek(-FINGERPRINT_BYTES, 2)
+                    digest.update(f.read(FINGERPRINT_BYTES))
+
+    return digest.hexdigest()[:12]
+
+
+def pack_entities(entities, groups):
+    """Сущности predict_entities -> {группа: [[start, end, label, confidence], ...]} (текст восстанавливается по позициям)"""
+    packed = {group_name: [] for group_name in groups}
+    for e in entities:
+        packed[e['group']].append([e['start'], e['end'], e['label'], round(e['confidence'], 4)])
+    return packed
+
+
+def unpack_entities(text, packed, group_name):
+    return [{
+        'start': start,
+        'end': end,
+        'label': label,
+        'text': text[start:end],
+        'confidence': confidence,
+        'group': group_name
+    } for start, end, label, confidence in packed]
+
+
+def load_bundle(file_path=EXAMPLE_BUNDLE_FILE):
+    if not Path(file_path).exists():
+        return {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_bundle(bundle, file_path=EXAMPLE_BUNDLE_FILE):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Разметка примеров сохранена: {file_path} ({Path(file_path).stat().st_size / 1024:.0f} КБ)")
+
+
+def load_annotations(tier, file_path=EXAMPLE_BUNDLE_FILE):
+    """Разметка примеров для режима {ключ текста: {группа: сущности}}; пустая, если бандл собран для других весов"""
+    entry = load_bundle(file_path).get(tier)
+    if entry is None:
+        print(f"Разметки примеров для режима {tier} нет в {file_path}")
+        return {}
+    if entry['revision'] != model_revision(tier):
+        print(f"Разметка примеров для режима {tier} устарела (модель изменилась), примеры считаются заново")
+        return {}
+    return entry['examples']
+
+
+def build_bundle(tiers=tuple(MODEL_TIERS), examples_file=EXAMPLES_FILE, file_path=EXAMPLE_BUNDLE_FILE):
+    """Прогоняет все примеры через модели каждого режима и обновляет бандл (остальные режимы не трогаются)"""
+    # models.py сам читает бандл, поэтому импорт здесь, а не в начале модуля
+    from modules.models import load_ner_model, limit_text, predict_entities
+
+    texts = [limit_text(text)[0] for text in pd.read_csv(examples_file)['text']]
+    bundle = load_bundle(file_path)
+
+    for tier in tiers:
+        revision = model_revision(tier)
+        pipelines = load_ner_model(tier) if revision is not None else {}
+        if not pipelines:
+            print(f"Режим {tier} пропущен: модель не найдена")
+            continue
+
+        start_time = time.time()
+        bundle[tier] = {
+            'revision': revision,
+            'examples': {
+                text_key(text): pack_entities(predict_entities(text, pipelines), pipelines.keys())
+                for text in texts
+            }
+        }
+        print(f"{tier}: {len(texts)} примеров размечено за {time.time() - start_time:.1f} с (ревизия {revision})")
+
+    save_bundle(bundle, file_path)
+    return bundle
+
+
+# Запуск (из папки app/, после обучения или замены моделей):
+# python -m modules.example_bundle --tiers standard merged fast
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Предрассчитанная разметка примеров для приложения")
+    parser.add_argument('--tiers', nargs='+', default=list(MODEL_TIERS), choices=list(MODEL_TIERS))
+    parser.add_argument('--output', default=EXAMPLE_BUNDLE_FILE)
+    args = parser.parse_args()
+
+    build_bundle(args.tiers, file_path=args.output)
@@ -0,0 +1,271 @@
+import json
+import time
+from collections import Counter, defaultdict, deque
+from pathlib import Path
+
+from modules.config import GAZETTEER_FILE, GAZETTEER_LABELS
+
+
+class AhoCorasick:
+    """
+    Автомат Ахо-Корасик: находит все словарные вхождения за один линейный проход по тексту.
+    Поиск регистронезависимый, совпадение засчитывается только по границам слов.
+    """
+
+    def __init__(self):
+        self.goto = [{}]      # переходы по символам
+        self.fail = [0]       # суффиксные ссылки
+        self.terminal = [[]]  # (длина фразы, метка, уверенность) фраз, оканчивающихся в состоянии
+        self.output = [[]]    # то же с учётом суффиксных ссылок (заполняется в build)
+
+    def add(self, phrase, label, confidence=1.0):
+        phrase = _fold_case(phrase)
+        state = 0
+        for char in phrase:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.terminal.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.terminal[state].append((len(phrase), label, confidence))
+
+    def build(self):
+        """Проставляет суффиксные ссылки обходом в ширину (после добавления всех фраз)"""
+        self.output = [list(outputs) for outputs in self.terminal]
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        return self
+
+    def iter_matches(self, text):
+        """Возвращает (start, end, label, confidence) для всех вхождений, стоящих на границах слов"""
+        state = 0
+        for i, char in enumerate(_fold_case(text)):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+
+            for length, label, confidence in self.output[state]:
+                start, end = i + 1 - length, i + 1
+                if _is_word_boundary(text, start, end):
+                    yield start, end, label, confidence
+
+    def __len__(self):
+        return len(self.goto)
+
+
+def _fold_case(text):
+    """
+    Нижний регистр посимвольно: символы, у которых lower() меняет длину (например, 'İ'),
+    остаются как есть, чтобы позиции в тексте и в автомате совпадали.
+    """
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def _is_word_boundary(text, start, end):
+    before = text[start - 1] if start > 0 else ' '
+    after = text[end] if end < len(text) else ' '
+    return not before.isalnum() and not after.isalnum()
+
+
+def harvest_gazetteer(results, labels=GAZETTEER_LABELS, min_count=2, min_purity=0.8, min_confidence=0.9):
+    """
+    Собирает словарь из прошлых предсказаний моделей.
+    results — список {'text': ..., 'entities': [...]} (формат инференса),
+    фраза попадает в словарь, если встречалась не реже min_count раз
+    и в доле min_purity случаев получала одну и ту же метку.
+    """
+    label_counts = defaultdict(Counter)
+    surface_forms = defaultdict(Counter)
+
+    for result in results:
+        text = str(result.get('text', ''))
+        for entity in result.get('entities', []):
+            if entity['label'] not in labels or entity['confidence'] < min_confidence:
+                continue
+            # Берём фразу из исходного текста: 'word' пайплайна может отличаться пробелами
+            phrase = text[entity['start']:entity['end']].strip() if text else entity['text'].strip()
+            if not phrase:
+                continue
+            key = phrase.lower()
+            label_counts[key][entity['label']] += 1
+            surface_forms[key][phrase] += 1
+
+    entries = {}
+    for key, counts in label_counts.items():
+        total = sum(counts.values())
+        label, count = counts.most_common(1)[0]
+        purity = count / total
+        if total >= min_count and purity >= min_purity:
+            entries[surface_forms[key].most_common(1)[0][0]] = {
+                'label': label,
+                'confidence': round(purity, 4),
+                'count': total
+            }
+
+    print(f"Собрано {len(entries)} фраз для словаря из {len(label_counts)} кандидатов")
+    return entries
+
+
+def save_gazetteer(entries, file_path=GAZETTEER_FILE):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    print(f"Словарь сохранён: {file_path} ({len(entries)} фраз)")
+
+
+def build_automaton(entries):
+    """Строит автомат по словарю {фраза: {'label', 'confidence', ...}}"""
+    automaton = AhoCorasick()
+    for phrase, entry in entries.items():
+        automaton.add(phrase, entry['label'], entry.get('confidence', 1.0))
+    return automaton.build()
+
+
+def load_gazetteer(file_path=GAZETTEER_FILE):
+    """Загружает словарь и строит автомат; None, если файла нет"""
+    if not Path(file_path).exists():
+        print(f"Словарь не найден: {file_path}")
+        return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    return build_automaton(entries)
+
+
+def gazetteer_entities(text, automaton, group_name='group2'):
+    """
+    Разметка точными словарными совпадениями в формате predict_entities.
+    Пересечения разрешаются как у модели: самое левое, затем самое длинное совпадение.
+    """
+    matches = sorted(automaton.iter_matches(text), key=lambda m: (m[0], m[0] - m[1]))
+
+    entities = []
+    last_end = 0
+    for start, end, label, confidence in matches:
+        if start < last_end:
+            continue
+        entities.append({
+            'start': start,
+            'end': end,
+            'label': label,
+            'text': text[start:end],
+            'confidence': float(confidence),
+            'group': group_name
+        })
+        last_end = end
+
+    return entities
+
+
+def evaluate_gazetteer(texts, automaton, reference, labels=GAZETTEER_LABELS):
+    """
+    Precision/recall словаря относительно эталона (предсказаний модели или разметки).
+    reference — список списков сущностей для каждого текста, совпадение по (start, end, label).
+    """
+    tp, fp, fn = Counter(), Counter(), Counter()
+    elapsed = 0.0
+
+    for text, ref_entities in zip(texts, reference):
+        t0 = time.perf_counter()
+        predicted = gazetteer_entities(text, automaton)
+        elapsed += time.perf_counter() - t0
+
+        pred_spans = {(e['start'], e['end'], e['label']) for e in predicted}
+        ref_spans = {(e['start'], e['end'], e['label']) for e in ref_entities if e['label'] in labels}
+
+        for span in pred_spans & ref_spans:
+            tp[span[2]] += 1
+        for span in pred_spans - ref_spans:
+            fp[span[2]] += 1
+        for span in ref_spans - pred_spans:
+            fn[span[2]] += 1
+
+    rows = []
+    for label in list(labels) + ['ALL']:
+        if label == 'ALL':
+            t, p, n = sum(tp.values()), sum(fp.values()), sum(fn.values())
+        else:
+            t, p, n = tp[label], fp[label], fn[label]
+        rows.append({
+            'Сущность': label,
+            'Precision': t / (t + p) if t + p else 0.0,
+            'Recall': t / (t + n) if t + n else 0.0,
+            'Support': t + n
+        })
+
+    print(f"Среднее время словаря на документ: {1000 * elapsed / max(len(texts), 1):.3f} мс")
+    return rows
+
+
+def _predict_group2(texts, ner_pipe):
+    """Предсказания модели Group 2 в формате harvest_gazetteer: [{'text': ..., 'entities': [...]}, ...]"""
+    # models.py сам импортирует этот модуль, поэтому импорт здесь
+    from modules.models import predict_entities
+    return [{'text': text, 'entities': predict_entities(text, {'group2': ner_pipe})} for text in texts]
+
+
+# Запуск (из папки app/): словарь собирается по train-части размеченных резюме (исходные тексты
+# из экспорта Label Studio, разбиение как в ноутбуках) или по неразмеченному корпусу --corpus,
+# отчёт считается на валидационных резюме против модели и разметки
+# python -m modules.gazetteer
+# python -m modules.gazetteer --corpus ../hh_ru_API_parser/resumes_json/converted --max-docs 200
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    from modules.config import DATASET_PATHS, GROUP_ENTITIES, LABELED_RESUMES_FILE
+    from modules.distillation import read_corpus
+    from modules.merged_model import read_iob_dataset, read_labeled_resumes, split_documents
+    from modules.models import load_ner_model
+
+    parser = argparse.ArgumentParser(description="Сборка словаря Group 2 и precision/recall против модели")
+    parser.add_argument('--tier', default='standard')
+    parser.add_argument('--dataset', default=DATASET_PATHS['group2'])
+    parser.add_argument('--labeled', default=LABELED_RESUMES_FILE)
+    parser.add_argument('--corpus', default=None)
+    parser.add_argument('--max-docs', type=int, default=None)
+    parser.add_argument('--min-count', type=int, default=2)
+    parser.add_argument('--min-purity', type=float, default=0.8)
+    parser.add_argument('--min-confidence', type=float, default=0.9)
+    parser.add_argument('--output', default=GAZETTEER_FILE)
+    args = parser.parse_args()
+
+    ner_pipe = load_ner_model(args.tier)['group2']
+    # IOB-датасет состоит из сабтокенов (Сбер ##банк), поэтому он нужен только для разбиения,
+    # а тексты и разметка берутся из исходных резюме
+    documents = read_iob_dataset(args.dataset)
+    resumes = read_labeled_resumes(args.labeled, labels=GROUP_ENTITIES['group2'])
+    if len(resumes) != len(documents):
+        raise ValueError(f"В {args.labeled} {len(resumes)} резюме, а в {args.dataset} {len(documents)} документов")
+    train_docs, val_docs = split_documents(documents, ner_pipe.engine.tokenizer)
+
+    if args.corpus:
+        harvest_texts = read_corpus(args.corpus, args.max_docs)
+    else:
+        harvest_texts = [resumes[i][0] for i in train_docs][:args.max_docs]
+
+    print(f"Предсказания модели Group 2 на {len(harvest_texts)} текстах...")
+    entries = harvest_gazetteer(_predict_group2(harvest_texts, ner_pipe), min_count=args.min_count,
+                                min_purity=args.min_purity, min_confidence=args.min_confidence)
+    save_gazetteer(entries, args.output)
+    automaton = build_automaton(entries)
+
+    val_texts, val_gold = zip(*(resumes[i] for i in val_docs))
+    model_results = _predict_group2(val_texts, ner_pipe)
+    gold = [[{'start': start, 'end': end, 'label': label} for start, end, label in spans] for spans in val_gold]
+
+    print(f"\nСловарь против модели ({len(val_texts)} документов валидации):")
+    print(pd.DataFrame(evaluate_gazetteer(val_texts, automaton, [r['entities'] for r in model_results])).round(4).to_string(index=False))
+    print("\nСловарь против разметки:")
+    print(pd.DataFrame(evaluate_gazetteer(val_texts, automaton, gold)).round(4).to_string(index=False))
@@ -0,0 +1,294 @@
+import argparse
+import json
+import random
+import time
+
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from transformers import AutoConfig, AutoModelForTokenClassification, AutoTokenizer, pipeline
+
+from modules.config import DATASET_PATHS, LABELED_RESUMES_FILE, LOCAL_MODEL_PATHS, MERGED_MODEL_PATH
+from modules.evaluation import evaluate_runs
+from modules.multihead import MultiHeadTokenClassifier, MultiHeadNERPipeline
+
+
+def merge_group_checkpoints(model_paths=LOCAL_MODEL_PATHS):
+    """
+    Собирает мультиголовую модель из трёх дообученных чекпоинтов.
+    Все три дообучены от Gherman/bert-base-NER-Russian, поэтому общий энкодер —
+    среднее их весов, а головы (classifier) переносятся без изменений.
+    """
+    encoder_sum = None
+    group_labels = {}
+    heads = {}
+    config = None
+
+    for group_name, path in model_paths.items():
+        print(f"Чтение чекпоинта {group_name} ({path})...")
+        model = AutoModelForTokenClassification.from_pretrained(path)
+        group_labels[group_name] = [model.config.id2label[i] for i in range(model.config.num_labels)]
+        heads[group_name] = {k: v.clone() for k, v in model.classifier.state_dict().items()}
+
+        encoder_state = model.base_model.state_dict()
+        if encoder_sum is None:
+            config = AutoConfig.from_pretrained(path)
+            encoder_sum = {k: v.clone().double() if v.is_floating_point() else v.clone() for k, v in encoder_state.items()}
+        else:
+            for k, v in encoder_state.items():
+                if v.is_floating_point():
+                    encoder_sum[k] += v.double()
+        del model
+
+    n_models = len(model_paths)
+    encoder_state = {k: (v / n_models).float() if v.is_floating_point() else v for k, v in encoder_sum.items()}
+
+    merged = MultiHeadTokenClassifier.from_config(config, group_labels)
+    merged.encoder.load_state_dict(encoder_state)
+    for group_name, state in heads.items():
+        merged.heads[group_name].load_state_dict(state)
+    return merged
+
+
+def read_iob_dataset(file_path):
+    """Чтение JSONL датасета {'tokens': [...], 'ner_tags': [...]} (как в datasets_preprocess)"""
+    documents = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            item = json.loads(line.strip())
+            documents.append((item['tokens'], item['ner_tags']))
+    return documents
+
+
+def read_labeled_resumes(file_path=LABELED_RESUMES_FILE, labels=None):
+    """
+    Исходные резюме из экспорта Label Studio: [(текст, [(start, end, label), ...]), ...] по символам.
+    Пустые резюме пропускаются, как в datasets_preprocess, поэтому i-е резюме соответствует i-й строке *_dataset.jsonl.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    documents = []
+    for item in data:
+        text = item['data']['text']
+        if not text.strip():
+            continue
+        spans = [
+            (result['value']['start'], result['value']['end'], result['value']['labels'][0])
+            for annotation in item['annotations'] for result in annotation['result'] if 'value' in result
+        ]
+        if labels is not None:
+            spans = [span for span in spans if span[2] in labels]
+        documents.append((text, sorted(spans)))
+    return documents
+
+
+def _count_windows(n_tokens, window_size, stride):
+    """Число окон create_sliding_windows_complete из kaggle_learning для документа из n_tokens токенов"""
+    if n_tokens <= window_size:
+        return 1
+    count, start = 0, 0
+    while start < n_tokens:
+        count += 1
+        if start + window_size >= n_tokens:
+            break
+        start += stride
+        if start + window_size >= n_tokens:
+            start = max(0, n_tokens - window_size)
+    return count
+
+
+def split_documents(documents, tokenizer, window_size=510, stride=64, val_fraction=0.2):
+    """
+    Повторяет разбиение train/validation из ноутбуков (seed 42, валидация набирается целыми документами),
+    чтобы сравнение шло на тех же документах, которые отдельные модели не видели.
+    """
+    windows_per_doc = [
+        _count_windows(len(tokenizer(tokens, is_split_into_words=True)['input_ids']), window_size, stride)
+        for tokens, _ in documents
+    ]
+    target_val_windows = int(sum(windows_per_doc) * val_fraction)
+
+    unique_docs = list(range(len(documents)))
+    random.seed(42)
+    random.shuffle(unique_docs)
+
+    val_docs, val_windows = set(), 0
+    for doc_idx in unique_docs:
+        if val_windows + windows_per_doc[doc_idx] <= target_val_windows * 1.1:
+            val_docs.add(doc_idx)
+            val_windows += windows_per_doc[doc_idx]
+        if val_windows >= target_val_windows:
+            break
+
+    train_docs = [i for i in range(len(documents)) if i not in val_docs]
+    return train_docs, sorted(val_docs)
+
+
+def make_training_windows(documents, label2id, tokenizer, max_length=512, stride=64):
+    """Окна с метками, выровненными по первому сабтокену слова (остальные -100)"""
+    windows = []
+    for tokens, tags in documents:
+        encoding = tokenizer(
+            tokens,
+            is_split_into_words=True,
+            truncation=True,
+            max_length=max_length,
+            stride=stride,
+            return_overflowing_tokens=True
+        )
+        for i, input_ids in enumerate(encoding['input_ids']):
+            labels, previous_word = [], None
+            for word_idx in encoding.word_ids(i):
+                if word_idx is None or word_idx == previous_word:
+                    labels.append(-100)
+                else:
+                    labels.append(label2id[tags[word_idx]])
+                previous_word = word_idx
+            windows.append((input_ids, labels))
+    return windows
+
+
+def finetune_multihead(model, tokenizer, dataset_paths=DATASET_PATHS, epochs=2, batch_size=8, lr=3e-5,
+                       freeze_encoder=False, device=None):
+    """
+    Дообучение общего энкодера и голов на трёх датасетах сразу: батчи групп чередуются,
+    лосс считается только по голове той группы, из чьего датасета батч.
+    """
+    device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model.to(device)
+    model.train()
+    for param in model.encoder.parameters():
+        param.requires_grad = not freeze_encoder
+
+    batches = []
+    for group_name, path in dataset_paths.items():
+        documents = read_iob_dataset(path)
+        train_docs, _ = split_documents(documents, tokenizer)
+        label2id = {label: i for i, label in enumerate(model.group_labels[group_name])}
+        windows = make_training_windows([documents[i] for i in train_docs], label2id, tokenizer)
+        print(f"{group_name}: {len(train_docs)} документов, {len(windows)} окон")
+        batches.extend((group_name, windows[i:i + batch_size]) for i in range(0, len(windows), batch_size))
+
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=lr, weight_decay=0.01)
+    for epoch in range(epochs):
+        random.shuffle(batches)
+        total_loss = 0.0
+        start_time = time.time()
+
+        for group_name, batch in batches:
+            padded = tokenizer.pad({'input_ids': [ids for ids, _ in batch]}, return_tensors='pt').to(device)
+            length = padded['input_ids'].shape[1]
+            labels = torch.tensor([l + [-100] * (length - len(l)) for _, l in batch], device=device)
+
+            logits = model(**padded, groups=[group_name])[group_name]
+            loss = F.cross_entropy(logits.reshape(-1, logits.shape[-1]), labels.reshape(-1), ignore_index=-100)
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+            total_loss += loss.item()
+
+        print(f"Эпоха {epoch + 1}/{epochs}: loss {total_loss / max(len(batches), 1):.4f} ({time.time() - start_time:.1f} с)")
+
+    model.eval()
+    return model
+
+
+def document_to_text(tokens, tags):
+    """Склеивает слова через пробел и переводит IOB-разметку в (start, end, label) по символам"""
+    text, spans = "", []
+    current = None
+    for token, tag in zip(tokens, tags):
+        if text:
+            text += " "
+        start, end = len(text), len(text) + len(token)
+        text += token
+
+        prefix, _, label = tag.partition('-')
+        if tag == 'O' or not label:
+            current = None
+        elif prefix == 'I' and current is not None and current[2] == label:
+            current[1] = end
+        else:
+            current = [start, end, label]
+            spans.append(current)
+    return text, [tuple(span) for span in spans]
+
+
+def compare_with_separate_models(merged_path=MERGED_MODEL_PATH, model_paths=LOCAL_MODEL_PATHS,
+                                 dataset_paths=DATASET_PATHS, stride=64):
+    """
+    F1 по сущностям на валидации: три отдельные модели против одной мультиголовой.
+    Сравнение по точному совпадению границ и метки на уровне символов (modules.evaluation).
+    """
+    tokenizer = AutoTokenizer.from_pretrained(merged_path)
+    engine = MultiHeadNERPipeline(MultiHeadTokenClassifier.from_pretrained(merged_path), tokenizer, stride=stride)
+    device = 0 if torch.cuda.is_available() else -1
+    separate_pipelines = {
+        group_name: pipeline("ner", model=path, tokenizer=path, aggregation_strategy="first",
+                             stride=stride, device=device)
+        for group_name, path in model_paths.items()
+    }
+
+    gold, all_texts = [], []
+    predictions = {'3 модели': [], 'общий энкодер': []}
+    for group_name, path in dataset_paths.items():
+        documents = read_iob_dataset(path)
+        _, val_docs = split_documents(documents, tokenizer)
+        for text, spans in (document_to_text(*documents[i]) for i in val_docs):
+            all_texts.append(text)
+            gold.append(spans)
+            predictions['3 модели'].append(separate_pipelines[group_name](text))
+            predictions['общий энкодер'].append(engine(text, groups=[group_name])[group_name])
+
+    metrics = evaluate_runs(gold, predictions, spans='entities')
+    f1 = metrics.pivot(index=['Группа', 'Сущность'], columns='Запуск', values='F1-Score')
+    support = metrics[metrics['Запуск'] == '3 модели'].set_index(['Группа', 'Сущность'])['Support']
+    comparison = pd.DataFrame({
+        'F1 (3 модели)': f1['3 модели'],
+        'F1 (общий энкодер)': f1['общий энкодер'],
+        'Δ F1': f1['общий энкодер'] - f1['3 модели'],
+        'Support': support
+    }).reset_index()
+    print(comparison.round(4).to_string(index=False))
+
+    # Время разметки всеми тремя группами, как в приложении
+    t0 = time.perf_counter()
+    for text in all_texts:
+        for ner_pipe in separate_pipelines.values():
+            ner_pipe(text)
+    time_separate = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for text in all_texts:
+        engine(text)
+    time_merged = time.perf_counter() - t0
+
+    print(f"\nВремя на {len(all_texts)} документов: 3 модели {time_separate:.1f} с, "
+          f"общий энкодер {time_merged:.1f} с (x{time_separate / max(time_merged, 1e-9):.1f})")
+    return comparison
+
+
+# Запуск (из папки app/):
+# python -m modules.merged_model --finetune-epochs 2 --compare
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка одной модели с общим энкодером и тремя головами")
+    parser.add_argument('--output', default=MERGED_MODEL_PATH)
+    parser.add_argument('--finetune-epochs', type=int, default=0)
+    parser.add_argument('--freeze-encoder', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    args = parser.parse_args()
+
+    merged_model = merge_group_checkpoints()
+    tokenizer = AutoTokenizer.from_pretrained(next(iter(LOCAL_MODEL_PATHS.values())))
+    if args.finetune_epochs:
+        merged_model = finetune_multihead(merged_model, tokenizer, epochs=args.finetune_epochs,
+                                          freeze_encoder=args.freeze_encoder)
+
+    merged_model.save_pretrained(args.output)
+    tokenizer.save_pretrained(args.output)
+    print(f"Объединённая модель сохранена в {args.output}")
+
+    if args.compare:
+        compare_with_separate_models(args.output)
@@ -1,31 +1,43 @@
+import queue
+import threading
+import time
+
 import streamlit as st
-from transformers import pipeline, AutoModelForTokenClassification, AutoTokenizer
-import torch
-from modules.config import MODEL_REPO, MODEL_SUBFOLDERS, LOCAL_MODEL_PATHS
+from transformers import AutoModelForTokenClassification, AutoTokenizer
+from modules.config import MODEL_REPO, MODEL_SUBFOLDERS, LOCAL_MODEL_PATHS, MULTIHEAD_MODEL_PATHS, MAX_TEXT_CHARS
+from modules.example_bundle import load_annotations, text_key, unpack_entities
+from modules.gazetteer import load_gazetteer, gazetteer_entities
+from modules.multihead import load_multihead_pipelines, single_model_pipeline
 
 
 @st.cache_resource
-def load_ner_model():
-    pipelines = {}
+def load_ner_model(tier='standard'):
+    """
+    Загружает модели выбранного уровня: 'standard' — три BERT-модели,
+    'merged' — один BERT-энкодер с тремя головами, 'fast' — дистиллированный студент
+    с тремя головами (формат вывода везде одинаковый).
+    """
+    if tier in MULTIHEAD_MODEL_PATHS:
+        model_path = MULTIHEAD_MODEL_PATHS[tier]
+        try:
+            print(f"Загрузка мультиголовой модели ({tier}) из {model_path}...")
+            return load_multihead_pipelines(model_path)
+        except Exception as e:
+            st.error(f"Ошибка загрузки модели {tier} из {model_path}: {e}")
+            return {}
 
-    # Определяем устройство: 0 для CUDA, -1 для CPU
-    device = 0 if torch.cuda.is_available() else -1
+    pipelines = {}
 
     for group_name, subfolder in MODEL_SUBFOLDERS.items():
         try:
-
+            # Модели оборачиваются в потоковый оконный пайплайн (окно 512, перекрытие 64, агрегация first),
+            # чтобы результаты можно было отдавать по окнам (iter_entities)
             if LOCAL_MODEL_PATHS:
                 model_source = LOCAL_MODEL_PATHS[group_name]
                 print(f"Загрузка группы {group_name} из подпапки {subfolder}...")
 
-                pipelines[group_name] = pipeline(
-                    "ner",
-                    model=model_source,
-                    tokenizer=model_source,
-                    aggregation_strategy="first",
-                    stride=64,
-                    device=device
-                )
+                tokenizer = AutoTokenizer.from_pretrained(model_source)
+                model = AutoModelForTokenClassification.from_pretrained(model_source)
             else:
                 model_source = MODEL_REPO
                 current_subfolder = subfolder
@@ -42,40 +54,161 @@ def load_ner_model():
                     model_source,
                     subfolder=current_subfolder,
                 )
-                pipelines[group_name] = pipeline(
-                    "ner",
-                    model=model,
-                    tokenizer=tokenizer,
-                    aggregation_strategy="first",
-                    stride=64,
-                    device=device
-                )
+
+            pipelines[group_name] = single_model_pipeline(model, tokenizer, group_name, stride=64)
         except Exception as e:
             st.error(f"Ошибка загрузки группы {group_name} из {subfolder}: {e}")
 
     return pipelines
 
 
-def predict_entities(text, pipelines):
-    """Предсказание сущностей выбранными моделями (как в твоём инференсе)"""
-    all_entities = []
+@st.cache_resource
+def load_gazetteer_automaton():
+    """Автомат Ахо-Корасик для быстрого режима Group 2 (None, если словарь не собран)"""
+    return load_gazetteer()
 
-    for group_name, ner_pipe in pipelines.items():
+
+@st.cache_resource
+def load_example_annotations(tier):
+    """Предрассчитанная разметка примеров для режима (пустая, если бандл не собран или устарел)"""
+    return load_annotations(tier)
+
+
+def bundled_entities(text, tier, groups, gazetteer=None):
+    """
+    Готовые сущности для текста из бандла примеров — без запуска моделей.
+    None, если текста нет в бандле (например, пример отредактировали): тогда нужен обычный анализ.
+    """
+    annotations = load_example_annotations(tier).get(text_key(text))
+    model_groups = [g for g in groups if gazetteer is None or g != 'group2']
+    if annotations is None or any(g not in annotations for g in model_groups):
+        return None
+
+    entities = []
+    for group_name in model_groups:
+        entities.extend(unpack_entities(text, annotations[group_name], group_name))
+    if gazetteer is not None and 'group2' in groups:
+        entities.extend(gazetteer_entities(text, gazetteer, group_name='group2'))
+
+    entities.sort(key=lambda x: x['start'])
+    return entities
+
+
+def _warm_up_worker(engines, text):
+    for engine in engines:
+        start_time = time.time()
         try:
-            entities = ner_pipe(text)
-
-            for entity in entities:
-                all_entities.append({
-                    'start': entity['start'],
-                    'end': entity['end'],
-                    'label': entity['entity_group'],
-                    'text': entity['word'],
-                    'confidence': float(entity['score']),
-                    'group': group_name
-                })
+            engine(text)
+            print(f"Прогрев модели: {time.time() - start_time:.1f} с")
         except Exception as e:
-            st.warning(f"Ошибка в модели {group_name}: {e}")
+            print(f"Ошибка прогрева модели: {e}")
+
+
+@st.cache_resource
+def start_warm_up(tier, text):
+    """
+    Один фоновый прогон каждой модели режима сразу после загрузки (один раз на режим),
+    чтобы первый настоящий запрос не платил за инициализацию torch.
+    """
+    engines = {ner_pipe.engine for ner_pipe in load_ner_model(tier).values()}
+    thread = threading.Thread(target=_warm_up_worker, args=(engines, text), daemon=True)
+    thread.start()
+    return thread
+
+
+def limit_text(text, max_chars=MAX_TEXT_CHARS):
+    """Обрезает слишком длинный текст по последнему пробелу до max_chars; возвращает (текст, был ли обрезан)"""
+    if max_chars is None or len(text) <= max_chars:
+        return text, False
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > 0 else max_chars], True
+
+
+def _to_app_entity(entity, group_name):
+    return {
+        'start': entity['start'],
+        'end': entity['end'],
+        'label': entity['entity_group'],
+        'text': entity['word'],
+        'confidence': float(entity['score']),
+        'group': group_name
+    }
+
+
+def _engine_worker(engine, groups, text, results, stop):
+    """
+    Прогоняет текст через движок в отдельном потоке и складывает готовые окна в очередь.
+    Между окнами проверяет stop: если анализ прерван (перезапуск скрипта Streamlit), поток завершается.
+    """
+    try:
+        for window_idx, n_windows, window_entities in engine.iter_windows(text, groups):
+            if stop.is_set():
+                return
+            for group_name, entities in window_entities.items():
+                results.put(('window', group_name, window_idx, n_windows, entities))
+    except Exception as e:
+        for group_name in groups:
+            results.put(('error', group_name, e))
+    finally:
+        results.put(('done', groups))
+
+
+def iter_entities(text, pipelines, gazetteer=None, max_chars=MAX_TEXT_CHARS):
+    """
+    Потоковое предсказание: генератор (группа, номер окна, всего окон, новые сущности).
+    Модели работают параллельно в фоновых потоках, поэтому первой приходит самая быстрая группа.
+    Группы одной мультиголовой модели считаются за один проход энкодера.
+    Текст длиннее max_chars обрезается (с предупреждением), окна считаются лениво батчами,
+    поэтому память не растёт с длиной документа.
+    С gazetteer модель Group 2 не запускается: COMPANIES/TECHNOLOGIES берутся из словаря, NAME пропадает.
+    """
+    text, truncated = limit_text(text, max_chars)
+    if truncated:
+        st.warning(f"Текст слишком длинный: проанализированы первые {len(text):,} символов.")
+
+    if gazetteer is not None:
+        pipelines = {k: v for k, v in pipelines.items() if k != 'group2'}
+        yield 'group2', 0, 1, gazetteer_entities(text, gazetteer, group_name='group2')
+
+    engines = {}
+    for group_name, ner_pipe in pipelines.items():
+        engines.setdefault(ner_pipe.engine, []).append(group_name)
+
+    results = queue.Queue()
+    stop = threading.Event()
+    for engine, groups in engines.items():
+        threading.Thread(target=_engine_worker, args=(engine, groups, text, results, stop), daemon=True).start()
+
+    # Если генератор бросили (close() при перезапуске скрипта) или упала ошибка — останавливаем потоки
+    try:
+        running = len(engines)
+        while running:
+            message = results.get()
+            if message[0] == 'done':
+                running -= 1
+            elif message[0] == 'error':
+                _, group_name, e = message
+                st.warning(f"Ошибка в модели {group_name}: {e}")
+            else:
+                _, group_name, window_idx, n_windows, entities = message
+                yield group_name, window_idx, n_windows, [_to_app_entity(e, group_name) for e in entities]
+    finally:
+        stop.set()
+
+
+def predict_entities(text, pipelines, gazetteer=None, on_update=None, max_chars=MAX_TEXT_CHARS):
+    """
+    Предсказание сущностей выбранными моделями (как в твоём инференсе).
+    Если передан gazetteer, Group 2 размечается словарём вместо модели
+    (в словаре только GAZETTEER_LABELS, поэтому NAME в этом режиме не выделяется).
+    on_update(группа, номер окна, всего окон, новые сущности) вызывается по мере готовности окон.
+    """
+    all_entities = []
+    for group_name, window_idx, n_windows, entities in iter_entities(text, pipelines, gazetteer, max_chars):
+        all_entities.extend(entities)
+        if on_update is not None:
+            on_update(group_name, window_idx, n_windows, entities)
 
     # Сортируем по позиции в тексте
     all_entities.sort(key=lambda x: x['start'])
-    return all_entities
\ No newline at end of file
+    return all_entities
@@ -0,0 +1,430 @@
+import json
+import multiprocessing
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+from safetensors.torch import load_file, save_file
+from transformers import AutoModel, AutoModelForTokenClassification, AutoTokenizer
+
+
+class MultiHeadTokenClassifier(nn.Module):
+    """
+    Один энкодер и отдельная голова token classification для каждой группы сущностей.
+    Энкодер считается один раз, головы применяются к общим скрытым состояниям.
+    """
+
+    def __init__(self, encoder, group_labels, dropout=0.1):
+        super().__init__()
+        self.encoder = encoder
+        # group_labels: {'group1': ['O', 'B-TIME', ...], ...} — порядок соответствует id метки
+        self.group_labels = {group: list(labels) for group, labels in group_labels.items()}
+        self.dropout = nn.Dropout(dropout)
+        hidden_size = encoder.config.hidden_size
+        self.heads = nn.ModuleDict({
+            group: nn.Linear(hidden_size, len(labels))
+            for group, labels in self.group_labels.items()
+        })
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, groups=None):
+        hidden = self.encoder(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids
+        ).last_hidden_state
+        hidden = self.dropout(hidden)
+        groups = groups or list(self.heads.keys())
+        return {group: self.heads[group](hidden) for group in groups}
+
+    def save_pretrained(self, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.encoder.save_pretrained(path / 'encoder')
+        save_file({k: v.contiguous() for k, v in self.heads.state_dict().items()}, str(path / 'heads.safetensors'))
+        with open(path / 'multihead_config.json', 'w', encoding='utf-8') as f:
+            json.dump({'groups': self.group_labels}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_pretrained(cls, path):
+        path = Path(path)
+        with open(path / 'multihead_config.json', 'r', encoding='utf-8') as f:
+            group_labels = json.load(f)['groups']
+        encoder = AutoModel.from_pretrained(path / 'encoder', add_pooling_layer=False)
+        model = cls(encoder, group_labels)
+        model.heads.load_state_dict(load_file(str(path / 'heads.safetensors')))
+        return model
+
+    @classmethod
+    def from_config(cls, encoder_config, group_labels):
+        """Новая (случайно инициализированная) модель — например, студент для дистилляции"""
+        encoder = AutoModel.from_config(encoder_config, add_pooling_layer=False)
+        return cls(encoder, group_labels)
+
+
+class MultiHeadNERPipeline:
+    """
+    Аналог pipeline("ner", aggregation_strategy="first", stride=64) для MultiHeadTokenClassifier.
+    Текст режется на перекрывающиеся окна, каждое окно проходит энкодер один раз.
+    Токен из перекрытия двух окон берётся из того, где он дальше от края,
+    поэтому после каждого окна готовые сущности можно отдавать сразу (iter_windows).
+    Окна токенизируются лениво и считаются батчами по batch_size, так что память
+    не зависит от длины документа.
+    """
+
+    # Сколько символов текста токенизируется под одно окно (с запасом; при нехватке кусок удваивается)
+    CHARS_PER_TOKEN = 8
+
+    def __init__(self, model, tokenizer, device=None, stride=64, max_length=512, batch_size=8):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.stride = stride
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.model.to(self.device)
+        self.model.eval()
+
+    @property
+    def groups(self):
+        return list(self.model.group_labels.keys())
+
+    def __call__(self, text, groups=None):
+        """Возвращает {группа: [сущности в формате HF pipeline]}"""
+        groups = groups or self.groups
+        results = {group: [] for group in groups}
+        for _, _, window_entities in self.iter_windows(text, groups):
+            for group, entities in window_entities.items():
+                results[group].extend(entities)
+        return results
+
+    def iter_windows(self, text, groups=None):
+        """
+        Генератор по окнам: (номер окна, оценка числа окон, {группа: сущности, завершённые в этом окне}).
+        Сущность на стыке окон отдаётся с тем окном, в котором она закончилась.
+        Число окон заранее неизвестно и уточняется по ходу; для последнего окна оно точное.
+        """
+        groups = groups or self.groups
+        aggregators = {group: _EntityAggregator(text, self.model.group_labels[group]) for group in groups}
+        from_char = 0
+
+        for batch in _batched(_with_next_start(self._iter_token_windows(text)), self.batch_size):
+            padded = self.tokenizer.pad(
+                {'input_ids': [window['input_ids'] for window, _ in batch]},
+                return_tensors='pt'
+            ).to(self.device)
+            with torch.no_grad():
+                logits = self.model(**padded, groups=groups)
+            probs = {group: torch.softmax(l, dim=-1).cpu().numpy() for group, l in logits.items()}
+
+            for i, (window, next_start) in enumerate(batch):
+                owned, from_char = _owned_positions(window, from_char, next_start)
+
+                window_entities = {}
+                for group, aggregator in aggregators.items():
+                    entities = []
+                    for p in owned:
+                        start, end = window['offsets'][p]
+                        entities.extend(aggregator.add(start, end, window['word_starts'][p], probs[group][i, p]))
+                    if next_start is None:
+                        entities.extend(aggregator.finish())
+                    window_entities[group] = entities
+
+                yield window['index'], window['n_windows'], window_entities
+
+    def _iter_token_windows(self, text):
+        """
+        Ленивая нарезка на окна по max_length токенов с перекрытием stride:
+        токенизируется только кусок текста под текущее окно, следующее окно начинается с начала слова.
+        """
+        n_special = self.tokenizer.num_special_tokens_to_add()
+        content_length = self.max_length - n_special
+        pos, index = 0, 0
+
+        while True:
+            budget = self.max_length * self.CHARS_PER_TOKEN
+            while True:
+                segment_end = min(len(text), pos + budget)
+                # Режем кусок по пробелу, чтобы последнее слово не токенизировалось обрезанным
+                cut = segment_end
+                while segment_end < len(text) and cut > pos and not text[cut - 1].isspace():
+                    cut -= 1
+                if cut > pos:
+                    segment_end = cut
+
+                encoding = self.tokenizer(
+                    text[pos:segment_end],
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_offsets_mapping=True
+                )
+                word_ids = encoding.word_ids()
+                content = [p for p, w in enumerate(word_ids) if w is not None]
+                truncated = len(content) >= content_length
+                # Окно не заполнено, а текст не кончился — берём кусок побольше (кроме кусков из одних пробелов)
+                if truncated or segment_end == len(text) or not content:
+                    break
+                budget *= 2
+
+            offsets = [(start + pos, end + pos) for start, end in encoding['offset_mapping']]
+            word_starts = [None] * len(word_ids)
+            first_token_of_word = {}
+            for p in content:
+                first_token_of_word.setdefault(word_ids[p], p)
+                word_starts[p] = offsets[first_token_of_word[word_ids[p]]][0]
+
+            finished = not truncated and segment_end == len(text)
+            if finished:
+                next_pos = len(text)
+            elif not content:
+                next_pos = segment_end
+            else:
+                # Следующее окно начинается за stride токенов до конца текущего, с начала слова
+                next_idx = max(len(content) - self.stride, 1)
+                while next_idx < len(content) and word_starts[content[next_idx]] != offsets[content[next_idx]][0]:
+                    next_idx += 1
+                if next_idx == len(content):
+                    next_idx = max(len(content) - self.stride, 1)
+                next_pos = offsets[content[next_idx]][0]
+
+            # Оценка числа окон по средней длине шага в символах
+            remaining = len(text) - next_pos
+            n_windows = index + 1 + (int(np.ceil(remaining * (index + 1) / max(next_pos, 1))) if remaining > 0 else 0)
+
+            if content or finished:
+                yield {
+                    'index': index,
+                    'n_windows': n_windows if not finished else index + 1,
+                    'input_ids': encoding['input_ids'],
+                    'offsets': offsets,
+                    'word_starts': word_starts,
+                    'first_start': offsets[content[0]][0] if content else None
+                }
+                index += 1
+
+            if finished:
+                return
+            pos = next_pos
+
+
+def _with_next_start(windows):
+    """Добавляет к каждому окну начало следующего (None для последнего) — заглядывание на одно окно вперёд"""
+    previous = None
+    for window in windows:
+        if previous is not None:
+            yield previous, window['first_start']
+        previous = window
+    if previous is not None:
+        yield previous, None
+
+
+def _batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _owned_positions(window, from_char, next_start):
+    """
+    Позиции токенов, за которые отвечает окно: всё, что не забрало предыдущее окно,
+    и первая половина перекрытия со следующим (граница — по началу слова).
+    Возвращает (позиции, граница для следующего окна).
+    """
+    offsets, word_starts = window['offsets'], window['word_starts']
+    content = [p for p, w in enumerate(word_starts) if w is not None and offsets[p][0] >= from_char]
+    if next_start is None:
+        return content, None
+
+    overlap = [p for p in content if offsets[p][0] >= next_start]
+    keep = (len(overlap) + 1) // 2
+    while keep < len(overlap) and word_starts[overlap[keep]] != offsets[overlap[keep]][0]:
+        keep += 1
+    if keep < len(overlap):
+        next_from = offsets[overlap[keep]][0]
+    else:
+        next_from = offsets[content[-1]][1] if content else from_char
+    return [p for p in content if offsets[p][0] < next_from], next_from
+
+
+class _EntityAggregator:
+    """
+    Потоковая агрегация "first": токены приходят по порядку, метка слова — по первому сабтокену
+    (сабтокены ##... склеиваются, как в HF pipeline), B-/I- склеиваются в сущности.
+    """
+
+    def __init__(self, text, labels):
+        self.text = text
+        self.labels = labels
+        self.word = None
+        self.current = None
+
+    def add(self, start, end, word_start, scores):
+        """Добавляет токен (word_start — начало его слова в тексте), возвращает сущности, которые он завершил"""
+        if self.word is not None and word_start == self.word['start']:
+            self.word['end'] = end
+            return []
+        closed = self._close_word()
+        idx = int(scores.argmax())
+        self.word = {'start': start, 'end': end, 'label': self.labels[idx], 'score': float(scores[idx])}
+        return closed
+
+    def finish(self):
+        return self._close_word() + self._flush()
+
+    def _close_word(self):
+        word, self.word = self.word, None
+        if word is None:
+            return []
+
+        tag, _, entity_type = word['label'].partition('-')
+        if word['label'] == 'O' or not entity_type:
+            return self._flush()
+        if tag == 'I' and self.current is not None and self.current['entity_group'] == entity_type:
+            self.current['end'] = word['end']
+            self.current['scores'].append(word['score'])
+            return []
+
+        closed = self._flush()
+        self.current = {'entity_group': entity_type, 'start': word['start'], 'end': word['end'], 'scores': [word['score']]}
+        return closed
+
+    def _flush(self):
+        entity, self.current = self.current, None
+        if entity is None:
+            return []
+        scores = entity.pop('scores')
+        entity['score'] = float(np.mean(scores))
+        entity['word'] = self.text[entity['start']:entity['end']]
+        return [entity]
+
+
+class GroupView:
+    """Представление одной группы мультиголовой модели с интерфейсом обычного NER pipeline"""
+
+    def __init__(self, engine, group):
+        self.engine = engine
+        self.group = group
+
+    def __call__(self, text):
+        return self.engine(text, groups=[self.group])[self.group]
+
+
+def load_multihead_pipelines(path, stride=64):
+    """Загружает мультиголовую модель и возвращает {группа: GroupView}, как load_ner_model"""
+    model = MultiHeadTokenClassifier.from_pretrained(path)
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    engine = MultiHeadNERPipeline(model, tokenizer, stride=stride)
+    return {group: GroupView(engine, group) for group in engine.groups}
+
+
+def single_model_pipeline(model, tokenizer, group, stride=64):
+    """Обычная модель *ForTokenClassification как мультиголовая с одной головой — для потокового вывода"""
+    labels = [model.config.id2label[i] for i in range(model.config.num_labels)]
+    wrapped = MultiHeadTokenClassifier(model.base_model, {group: labels})
+    wrapped.heads[group] = model.classifier
+    return GroupView(MultiHeadNERPipeline(wrapped, tokenizer, stride=stride), group)
+
+
+def _synthetic_text(n_chars, seed=0):
+    """Синтетический текст заданной длины из слов, похожих на резюме (для профилирования)"""
+    words = ["Python", "Docker", "Сбер", "опыт", "работы", "2020-2023", "ML,", "инженер", "PostgreSQL", "Москва"]
+    rng = random.Random(seed)
+    lines, length = [], 0
+    while length < n_chars:
+        line = " ".join(rng.choice(words) for _ in range(1000))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)[:n_chars]
+
+
+def _load_engine(model_path):
+    """Мультиголовая модель или обычная *ForTokenClassification (как одна голова)"""
+    if (Path(model_path) / 'multihead_config.json').exists():
+        return MultiHeadNERPipeline(MultiHeadTokenClassifier.from_pretrained(model_path), AutoTokenizer.from_pretrained(model_path))
+    model = AutoModelForTokenClassification.from_pretrained(model_path)
+    return single_model_pipeline(model, AutoTokenizer.from_pretrained(model_path), 'group').engine
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КБ, macOS — байты
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _profile_worker(model_path, n_chars, results):
+    engine = _load_engine(model_path)
+    text = _synthetic_text(n_chars)
+    base = _peak_rss_mb()
+
+    start_time = time.time()
+    n_windows, n_entities = 0, 0
+    for _, _, window_entities in engine.iter_windows(text):
+        n_windows += 1
+        n_entities += sum(len(entities) for entities in window_entities.values())
+
+    results.put({
+        'Символов': n_chars,
+        'Окон': n_windows,
+        'Сущностей': n_entities,
+        'Рост пикового RSS, МБ': round(_peak_rss_mb() - base, 1),
+        'Время, с': round(time.time() - start_time, 1)
+    })
+
+
+def profile_memory(model_path, sizes=(100_000, 1_000_000), max_ratio=2.0):
+    """
+    Рост пикового RSS при разметке синтетического текста разной длины через iter_windows (без MAX_TEXT_CHARS).
+    Пиковый RSS процесса не сбрасывается, поэтому каждый размер считается в отдельном процессе.
+    Если рост для самого длинного текста больше, чем в max_ratio раз выше, чем для самого короткого, — ошибка.
+    """
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for n_chars in sizes:
+        results = context.Queue()
+        process = context.Process(target=_profile_worker, args=(model_path, n_chars, results))
+        process.start()
+        # Результат — маленький dict, поэтому можно дождаться процесса до чтения очереди
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Профилирование {n_chars:,} символов завершилось с кодом {process.exitcode}")
+        row = results.get()
+        print(row)
+        rows.append(row)
+
+    smallest, largest = rows[0]['Рост пикового RSS, МБ'], rows[-1]['Рост пикового RSS, МБ']
+    ratio = largest / max(smallest, 1.0)
+    print(f"Рост памяти: {largest} МБ на {sizes[-1]:,} символов против {smallest} МБ на {sizes[0]:,} (x{ratio:.1f})")
+    if ratio > max_ratio:
+        raise RuntimeError(f"Память растёт с длиной документа: x{ratio:.1f} > x{max_ratio}")
+    return rows
+
+
+# Запуск (из папки app/, только Linux/macOS — нужен модуль resource):
+# python -m modules.multihead --profile
+# python -m modules.multihead --profile --model ../models/model_merged
+
+if __name__ == "__main__":
+    import argparse
+
+    from modules.config import LOCAL_MODEL_PATHS
+
+    parser = argparse.ArgumentParser(description="Профиль памяти оконного NER на длинных текстах")
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--model', default=LOCAL_MODEL_PATHS['group1'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--max-ratio', type=float, default=2.0)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile_memory(args.model, args.sizes, args.max_ratio)
+    else:
+        parser.print_help()
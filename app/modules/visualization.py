@@ -14,21 +14,26 @@ def color_text(text, entities, entity_colors):
 
     sorted_stops = sorted(list(stops))
 
-    # 2. Для каждого интервала между точками разреза ищем подходящие сущности
+    # 2. Проходим интервалы слева направо, поддерживая список сущностей, покрывающих текущую точку
+    # (один проход вместо перебора всех сущностей для каждого интервала — важно для длинных текстов)
+    starts_at = {}
+    for order, e in enumerate(entities):
+        starts_at.setdefault(e['start'], []).append((order, e))
+
     html_segments = []
+    active = []
     for i in range(len(sorted_stops) - 1):
         start, end = sorted_stops[i], sorted_stops[i + 1]
         segment_text = text[start:end]
 
+        # Сущности, которые покрывают этот интервал
+        active = [(o, e) for o, e in active if e['end'] > start]
+        active += [(o, e) for o, e in starts_at.get(start, []) if e['end'] > start]
+        matched_entities = [e for _, e in sorted(active, key=lambda item: item[0])]
+
         if not segment_text:
             continue
 
-        # Ищем все сущности, которые покрывают этот интервал
-        matched_entities = [
-            e for e in entities
-            if e['start'] <= start and e['end'] >= end
-        ]
-
         # Экранируем текст сегмента
         safe_text = escape_html(segment_text)
 